@@ -1,8 +1,14 @@
 import streamlit as st
 from rxn4chemistry import RXN4ChemistryWrapper
-import json
+import jinja2
+import msgpack
+import orjson
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import islice
 import os
+import time
 
 # Page configuration
 st.set_page_config(
@@ -12,8 +18,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for better styling
-st.markdown("""
+# Custom CSS for better styling - the string is built once per process;
+# it must still be emitted on each run so the replaced element tree
+# keeps the styles
+@st.cache_resource
+def _page_css() -> str:
+    """Return the app-wide CSS block."""
+    return """
     <style>
     .main-header {
         font-size: 2.5rem;
@@ -56,18 +67,142 @@ st.markdown("""
         border-left: 5px solid #dc3545;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_page_css(), unsafe_allow_html=True)
 
 # Initialize session state
 if 'extraction_history' not in st.session_state:
-    st.session_state.extraction_history = []
-if 'api_initialized' not in st.session_state:
-    st.session_state.api_initialized = False
+    # Bounded: long sessions keep at most 200 entries in memory
+    st.session_state.extraction_history = deque(maxlen=200)
 if 'api_key' not in st.session_state:
     st.session_state.api_key = None
 
-# Function to load API key with multiple fallback methods
-def load_api_key():
+# Shared API wrapper - cached once per API key so all sessions and reruns
+# reuse the same client (and its underlying connection pool)
+@st.cache_resource
+def get_rxn_wrapper(api_key: str):
+    """Create the RXN4Chemistry client once per API key."""
+    return RXN4ChemistryWrapper(api_key=api_key)
+
+# Shared worker pool so concurrent extractions from multiple sessions
+# overlap their network round trips while staying below the API's
+# throttling limits
+@st.cache_resource
+def get_api_executor():
+    """Create a bounded executor shared by all sessions."""
+    return ThreadPoolExecutor(max_workers=5, thread_name_prefix="rxn-api")
+
+# Memoized API call - identical paragraphs are served from the cache
+# instead of re-hitting the network. The leading underscore tells
+# Streamlit not to hash the unserializable wrapper.
+@st.cache_data(ttl=86400, max_entries=512, show_spinner=False)
+def extract_actions(_wrapper, paragraph: str):
+    """Call paragraph_to_actions through the shared pool, caching per paragraph."""
+    future = get_api_executor().submit(_wrapper.paragraph_to_actions, paragraph=paragraph)
+    return future.result(timeout=60)
+
+# Step-box template - compiled once per process; Jinja2 escapes the
+# action text in C rather than per-call Python string scanning
+@st.cache_resource
+def _step_template():
+    """Compile the step-box HTML template."""
+    return jinja2.Template(
+        "{% for i, action in steps %}"
+        '<div class="step-box"><strong>Step {{ i }}:</strong> {{ action|e }}</div>'
+        "{% endfor %}"
+    )
+
+# Download payloads - built once per unique result instead of on every
+# rerun after an extraction. Actions are passed as tuples for hashability.
+@st.cache_data(show_spinner=False)
+def _json_payload(result):
+    """Serialize the full API result for the JSON download.
+
+    Returns bytes: download_button accepts them directly, skipping
+    Streamlit's UTF-8 re-encode of str payloads.
+    """
+    return orjson.dumps(result, option=orjson.OPT_INDENT_2)
+
+@st.cache_data(show_spinner=False)
+def _txt_payload(actions: tuple):
+    """Format actions as plain text for the TXT download."""
+    return "\n\n".join(f"Step {i}: {action}" for i, action in enumerate(actions, 1))
+
+@st.cache_data(show_spinner=False)
+def _md_payload(actions: tuple):
+    """Format actions as Markdown for the MD download."""
+    return "# Extracted Protocol Steps\n\n" + "\n\n".join(f"**Step {i}:** {action}" for i, action in enumerate(actions, 1))
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _preview(text: str) -> str:
+    """Truncate input text for the history preview."""
+    return (text[:100] + "...") if len(text) > 100 else text
+
+@st.cache_data(show_spinner=False)
+def _fmt_ts(ns: int) -> str:
+    """Format a nanosecond timestamp for history display."""
+    return datetime.fromtimestamp(ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+
+# Download buttons - a fragment so a download click reruns only this
+# section instead of the whole script; the payload helpers above make
+# construction a one-time cost per result
+@st.fragment
+def _render_downloads(result, actions):
+    st.subheader("💾 Download Results:")
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        # Download as JSON
+        st.download_button(
+            label="📥 Download JSON",
+            data=_json_payload(result),
+            file_name="protocol_steps.json",
+            mime="application/json",
+            use_container_width=True
+        )
+    
+    with col2:
+        # Download as TXT
+        st.download_button(
+            label="📥 Download TXT",
+            data=_txt_payload(tuple(actions)),
+            file_name="protocol_steps.txt",
+            mime="text/plain",
+            use_container_width=True
+        )
+    
+    with col3:
+        # Download as Markdown
+        st.download_button(
+            label="📥 Download MD",
+            data=_md_payload(tuple(actions)),
+            file_name="protocol_steps.md",
+            mime="text/markdown",
+            use_container_width=True
+        )
+
+# Example procedures - module-level constants so the literals are
+# allocated once per process rather than on every rerun
+EXAMPLE_1 = """To a solution of 2-bromopyridine (1.0 g, 6.33 mmol) in THF (20 mL) 
+    at -78°C was added n-BuLi (2.5 M in hexanes, 2.78 mL, 6.96 mmol) dropwise. 
+    The mixture was stirred for 30 min at -78°C, then DMF (0.74 mL, 9.5 mmol) was added. 
+    The reaction was warmed to room temperature and stirred for 2 h. The mixture was 
+    quenched with saturated NH4Cl solution and extracted with EtOAc (3 x 20 mL). 
+    The combined organic layers were dried over Na2SO4, filtered, and concentrated 
+    under reduced pressure to give the crude product."""
+
+EXAMPLE_2 = """A mixture of benzaldehyde (10.6 g, 100 mmol) and acetone (7.3 mL, 100 mmol) 
+    in ethanol (50 mL) was treated with 10% NaOH solution (10 mL). The mixture was stirred 
+    at room temperature for 3 hours. The precipitate was collected by filtration, washed 
+    with cold ethanol, and dried to afford the product as a yellow solid (12.5 g, 85% yield)."""
+
+EXAMPLES = (("Load Example 1", EXAMPLE_1), ("Load Example 2", EXAMPLE_2))
+
+# API key resolution - cached so the secrets/env/toml fallback chain
+# runs once per process, with each method short-circuiting the next
+@st.cache_resource
+def _resolve_api_key():
     """Try multiple methods to load the API key"""
     
     # Method 1: Try Streamlit secrets (for deployment)
@@ -99,55 +234,31 @@ def load_api_key():
     
     return None
 
-# Sidebar
-with st.sidebar:
-    st.header("📋 About")
-    st.markdown("""
-    This tool uses **IBM RXN for Chemistry** to extract structured synthesis 
-    protocol steps from natural language descriptions of chemical reactions.
-    
-    ### Features:
-    - 🔍 Extract action steps
-    - 📝 View detailed results
-    - 💾 Download extracted protocols
-    - 📊 History tracking
-    
-    ### How to use:
-    1. Enter your API key (if not configured)
-    2. Paste your reaction procedure
-    3. Click "Extract Protocol Steps"
-    4. Review the structured output
-    """)
-    
-    st.divider()
-    
-    st.header("⚙️ Settings")
-    show_raw_response = st.checkbox("Show raw API response", value=False)
-    enable_history = st.checkbox("Enable extraction history", value=True)
-    
-    if enable_history and st.session_state.extraction_history:
-        if st.button("Clear History", type="secondary"):
-            st.session_state.extraction_history = []
-            st.rerun()
-    
-    st.divider()
-    
-    # API Key Configuration in Sidebar
+# API key configuration - isolated in a fragment so interactions inside
+# it (typing or saving a key) rerun only this section. Key changes flip
+# the page gate below, so those still trigger a full app rerun.
+@st.fragment
+def _render_api_config():
     st.header("🔑 API Configuration")
     
     # Check if API key is already loaded
     if not st.session_state.api_key:
-        st.session_state.api_key = load_api_key()
-    
+        st.session_state.api_key = _resolve_api_key()
+
     if st.session_state.api_key:
+        # Mask once per key change instead of reslicing on every rerun
+        if not st.session_state.get('api_key_masked'):
+            key = st.session_state.api_key
+            st.session_state.api_key_masked = f"{key[:10]}...{key[-10:]}"
         st.success("✅ API Key loaded successfully!")
-        masked_key = st.session_state.api_key[:10] + "..." + st.session_state.api_key[-10:]
-        st.text(f"Key: {masked_key}")
-        
+        st.text(f"Key: {st.session_state.api_key_masked}")
+
         if st.button("Change API Key"):
             st.session_state.api_key = None
-            st.session_state.api_initialized = False
-            st.rerun()
+            st.session_state.api_key_masked = None
+            get_rxn_wrapper.clear()
+            _resolve_api_key.clear()
+            st.rerun(scope="app")
     else:
         st.warning("⚠️ API Key not found")
         
@@ -175,9 +286,44 @@ with st.sidebar:
         
         if st.button("Save API Key") and manual_key:
             st.session_state.api_key = manual_key
-            st.session_state.api_initialized = False
             st.success("✅ API Key saved for this session!")
-            st.rerun()
+            st.rerun(scope="app")
+
+# Sidebar
+with st.sidebar:
+    st.header("📋 About")
+    st.markdown("""
+    This tool uses **IBM RXN for Chemistry** to extract structured synthesis 
+    protocol steps from natural language descriptions of chemical reactions.
+    
+    ### Features:
+    - 🔍 Extract action steps
+    - 📝 View detailed results
+    - 💾 Download extracted protocols
+    - 📊 History tracking
+    
+    ### How to use:
+    1. Enter your API key (if not configured)
+    2. Paste your reaction procedure
+    3. Click "Extract Protocol Steps"
+    4. Review the structured output
+    """)
+    
+    st.divider()
+    
+    st.header("⚙️ Settings")
+    show_raw_response = st.checkbox("Show raw API response", value=False)
+    enable_history = st.checkbox("Enable extraction history", value=True)
+    
+    if enable_history and st.session_state.extraction_history:
+        if st.button("Clear History", type="secondary"):
+            # No explicit rerun needed: the history section below runs
+            # after the sidebar in this same pass and sees the cleared deque
+            st.session_state.extraction_history.clear()
+    
+    st.divider()
+    
+    _render_api_config()
 
 # Main content
 st.markdown('<h1 class="main-header">🧪 IBM RXN Chemistry Protocol Extractor</h1>', unsafe_allow_html=True)
@@ -192,23 +338,22 @@ if not st.session_state.api_key:
     """, unsafe_allow_html=True)
     st.stop()
 
-st.markdown("""
+@st.cache_resource
+def _instructions_html() -> str:
+    """Return the static instructions banner."""
+    return """
 <div class="info-box">
     <strong>📌 Instructions:</strong> Paste a chemical reaction procedure below. 
     The AI will identify and extract individual synthesis steps such as additions, 
     heating, stirring, purification, etc.
 </div>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_instructions_html(), unsafe_allow_html=True)
 
 # Initialize API wrapper with error handling
 try:
-    if not st.session_state.api_initialized:
-        with st.spinner("🔄 Initializing IBM RXN API..."):
-            rxn_wrapper = RXN4ChemistryWrapper(api_key=st.session_state.api_key)
-            st.session_state.rxn_wrapper = rxn_wrapper
-            st.session_state.api_initialized = True
-    else:
-        rxn_wrapper = st.session_state.rxn_wrapper
+    rxn_wrapper = get_rxn_wrapper(st.session_state.api_key)
 except Exception as e:
     st.markdown(f"""
     <div class="error-box">
@@ -219,32 +364,18 @@ except Exception as e:
     st.info("💡 Please check your API key is valid and try again.")
     if st.button("Reset API Configuration"):
         st.session_state.api_key = None
-        st.session_state.api_initialized = False
+        st.session_state.api_key_masked = None
+        get_rxn_wrapper.clear()
+        _resolve_api_key.clear()
         st.rerun()
     st.stop()
 
 # Example procedures
 with st.expander("📖 View Example Procedures"):
-    example1 = """To a solution of 2-bromopyridine (1.0 g, 6.33 mmol) in THF (20 mL) 
-    at -78°C was added n-BuLi (2.5 M in hexanes, 2.78 mL, 6.96 mmol) dropwise. 
-    The mixture was stirred for 30 min at -78°C, then DMF (0.74 mL, 9.5 mmol) was added. 
-    The reaction was warmed to room temperature and stirred for 2 h. The mixture was 
-    quenched with saturated NH4Cl solution and extracted with EtOAc (3 x 20 mL). 
-    The combined organic layers were dried over Na2SO4, filtered, and concentrated 
-    under reduced pressure to give the crude product."""
-    
-    example2 = """A mixture of benzaldehyde (10.6 g, 100 mmol) and acetone (7.3 mL, 100 mmol) 
-    in ethanol (50 mL) was treated with 10% NaOH solution (10 mL). The mixture was stirred 
-    at room temperature for 3 hours. The precipitate was collected by filtration, washed 
-    with cold ethanol, and dried to afford the product as a yellow solid (12.5 g, 85% yield)."""
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("Load Example 1", use_container_width=True):
-            st.session_state.example_text = example1
-    with col2:
-        if st.button("Load Example 2", use_container_width=True):
-            st.session_state.example_text = example2
+    cols = st.columns(len(EXAMPLES))
+    for col, (label, text) in zip(cols, EXAMPLES):
+        if col.button(label, use_container_width=True, key=label):
+            st.session_state.example_text = text
 
 # Text input area
 input_text = st.text_area(
@@ -277,11 +408,14 @@ if extract_button:
     else:
         with st.spinner("🔄 Extracting synthesis protocol steps..."):
             try:
-                # Call IBM RXN API
-                result = rxn_wrapper.paragraph_to_actions(paragraph=input_text)
+                # Call IBM RXN API (cached per paragraph)
+                result = extract_actions(rxn_wrapper, input_text)
                 
                 # Store result in session state
-                st.session_state.last_result = result
+                # Keep the stored copy packed; it is only decoded when
+                # actually needed, and packed bytes are far smaller than
+                # the live dict tree
+                st.session_state.last_result_packed = msgpack.packb(result, use_bin_type=True)
                 
                 # Extract actions
                 actions = result.get("actions", [])
@@ -297,12 +431,10 @@ if extract_button:
                     # Display extracted steps
                     st.subheader("📋 Extracted Protocol Steps:")
                     
-                    for i, action in enumerate(actions, 1):
-                        st.markdown(f"""
-                        <div class="step-box">
-                            <strong>Step {i}:</strong> {action}
-                        </div>
-                        """, unsafe_allow_html=True)
+                    # Single markdown call: one frame to the browser
+                    # instead of one per step
+                    steps_html = _step_template().render(steps=list(enumerate(actions, 1)))
+                    st.markdown(steps_html, unsafe_allow_html=True)
                     
                     # Show raw response if enabled
                     if show_raw_response:
@@ -312,48 +444,14 @@ if extract_button:
                     # Add to history
                     if enable_history:
                         st.session_state.extraction_history.append({
-                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            'input': input_text[:100] + "..." if len(input_text) > 100 else input_text,
+                            'timestamp': time.time_ns(),
+                            'input': _preview(input_text),
                             'steps_count': len(actions),
-                            'actions': actions
+                            'actions': msgpack.packb(actions, use_bin_type=True)
                         })
                     
                     # Download options
-                    st.subheader("💾 Download Results:")
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        # Download as JSON
-                        json_data = json.dumps(result, indent=2)
-                        st.download_button(
-                            label="📥 Download JSON",
-                            data=json_data,
-                            file_name="protocol_steps.json",
-                            mime="application/json",
-                            use_container_width=True
-                        )
-                    
-                    with col2:
-                        # Download as TXT
-                        txt_data = "\n\n".join([f"Step {i}: {action}" for i, action in enumerate(actions, 1)])
-                        st.download_button(
-                            label="📥 Download TXT",
-                            data=txt_data,
-                            file_name="protocol_steps.txt",
-                            mime="text/plain",
-                            use_container_width=True
-                        )
-                    
-                    with col3:
-                        # Download as Markdown
-                        md_data = "# Extracted Protocol Steps\n\n" + "\n\n".join([f"**Step {i}:** {action}" for i, action in enumerate(actions, 1)])
-                        st.download_button(
-                            label="📥 Download MD",
-                            data=md_data,
-                            file_name="protocol_steps.md",
-                            mime="text/markdown",
-                            use_container_width=True
-                        )
+                    _render_downloads(result, actions)
                 
                 else:
                     st.info("ℹ️ No protocol steps extracted. Please verify the input format and try again.")
@@ -373,17 +471,31 @@ if extract_button:
                 - Try with one of the example procedures first
                 """)
 
-# Display extraction history
-if enable_history and st.session_state.extraction_history:
+# Formatted step list for one history entry - keyed by the packed
+# actions themselves, so the shared cache can never hand one session
+# another session's steps
+@st.cache_data(show_spinner=False)
+def _steps_md(actions_packed: bytes) -> str:
+    """Format the step list of a history entry."""
+    return "\n".join(
+        f"{i}. {action}"
+        for i, action in enumerate(msgpack.unpackb(actions_packed, raw=False), 1)
+    )
+
+# Display extraction history (fragment: interactions inside it only
+# rerun this subtree instead of the whole script)
+@st.fragment
+def _render_history():
     st.divider()
     st.subheader("📜 Extraction History")
     
-    for idx, entry in enumerate(reversed(st.session_state.extraction_history[-5:]), 1):
-        with st.expander(f"🕐 {entry['timestamp']} - {entry['steps_count']} steps extracted"):
+    for entry in islice(reversed(st.session_state.extraction_history), 5):
+        with st.expander(f"🕐 {_fmt_ts(entry['timestamp'])} - {entry['steps_count']} steps extracted"):
             st.write(f"**Input preview:** {entry['input']}")
-            st.write("**Extracted steps:**")
-            for i, action in enumerate(entry['actions'], 1):
-                st.write(f"{i}. {action}")
+            st.markdown(f"**Extracted steps:**\n{_steps_md(entry['actions'])}")
+
+if enable_history and st.session_state.extraction_history:
+    _render_history()
 
 # Footer
 st.divider()